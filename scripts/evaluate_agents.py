@@ -1,14 +1,11 @@
 import argparse
 import logging
 from src.utils import setup_logging
-from src.models import QwenVLM
 from src.data_loader import load_dataset, show_data
 from src.zero_shot import run_zero_shot
 from src.agent_pipelines.classic_agent import run_classic_agent_pipeline
 from src.agent_pipelines.dl_agent import run_dl_agent_pipeline
 
-# Setup logging
-setup_logging()
 logger = logging.getLogger(__name__)
 
 def main():
@@ -32,25 +29,75 @@ def main():
         default='data/images',
         help="Path to the directory containing images."
     )
+    parser.add_argument(
+        '--check_paths',
+        action='store_true',
+        help="Check that every image in the dataset exists before running."
+    )
     parser.add_argument(
         '--model_name',
         type=str,
         default='Qwen/Qwen2.5-VL-3B-Instruct',
         help="Name of the Hugging Face model to use."
     )
+    parser.add_argument(
+        '--judge_model_name',
+        type=str,
+        default='Qwen/Qwen2.5-1.5B-Instruct',
+        help="Name or local path of the Hugging Face model used as the judge. Text-only "
+             "models are loaded with QwenLLM; vision-language models reuse the VLM wrapper."
+    )
+    parser.add_argument(
+        '--judge_quantization',
+        type=str,
+        default='8bit',
+        choices=['none', '8bit', '4bit'],
+        help="Judge: bitsandbytes weight quantization for text-only judge models (CUDA only)."
+    )
     parser.add_argument(
         '--sample_index',
         type=int,
         default=0,
         help="Index of the sample to show if mode is 'show_sample'."
     )
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=8,
+        help="Number of dataset rows per batched VLM call. Use 1 for per-row inference."
+    )
+    parser.add_argument(
+        '--hsv_colors',
+        action='store_true',
+        help="Classic agent: classify colors with HSV bounds instead of the BGR rules "
+             "calibrated on the bundled dataset. Use for images outside that palette."
+    )
+    parser.add_argument(
+        '--strict_cot',
+        action='store_true',
+        help="DL agent: run plan, context and answer as three separate VLM calls "
+             "instead of one structured call."
+    )
+    parser.add_argument(
+        '--rule_fastpath',
+        action='store_true',
+        help="Classic agent: answer simple color/shape/count questions directly "
+             "from the detected objects, skipping the VLM."
+    )
+    parser.add_argument(
+        '--num_workers',
+        type=int,
+        default=0,
+        help="Classic agent: worker processes that prefetch object detection "
+             "(default: 0, detection runs inline; worth it only for large images or datasets)."
+    )
     
     args = parser.parse_args()
     
     logger.info(f"Starting script in mode: {args.mode}")
 
     # --- 1. Load Dataset ---
-    dataset = load_dataset(args.data_csv, args.images_dir)
+    dataset = load_dataset(args.data_csv, args.images_dir, check_paths=args.check_paths)
     if dataset is None:
         logger.error("Failed to load dataset. Exiting.")
         return
@@ -61,13 +108,20 @@ def main():
         return
 
     # --- 3. Load Model(s) ---
-    # We load the main VLM and a separate instance for the judge
-    # to avoid context pollution, although they can be the same model.
+    # We load the main VLM and a separate, smaller text-only model for the judge.
+    # The judge only reads text and answers Yes/No, so it needs no vision tower.
+    # Imported here so detection worker processes, which re-import this script,
+    # don't pull in torch/transformers.
+    from src.models import QwenLLM, QwenVLM, is_vision_language_model
     try:
         logger.info("Loading main VLM...")
         vlm = QwenVLM(args.model_name)
-        logger.info("Loading Judge VLM...")
-        judge_vlm = QwenVLM(args.model_name)
+        logger.info("Loading Judge model...")
+        if is_vision_language_model(args.judge_model_name):
+            judge_vlm = QwenVLM(args.judge_model_name)
+        else:
+            quantization = None if args.judge_quantization == 'none' else args.judge_quantization
+            judge_vlm = QwenLLM(args.judge_model_name, quantization=quantization)
     except Exception as e:
         logger.error(f"Failed to load VLM models: {e}. Exiting.")
         return
@@ -77,21 +131,26 @@ def main():
 
     if args.mode in ['zero_shot', 'all']:
         try:
-            acc, _ = run_zero_shot(vlm, dataset, judge_vlm)
+            acc, _ = run_zero_shot(vlm, dataset, judge_vlm, batch_size=args.batch_size)
             results['Zero-Shot'] = acc
         except Exception as e:
             logger.error(f"Error during Zero-Shot evaluation: {e}", exc_info=True)
 
     if args.mode in ['classic', 'all']:
         try:
-            acc, _ = run_classic_agent_pipeline(vlm, dataset, judge_vlm)
+            acc, _ = run_classic_agent_pipeline(
+                vlm, dataset, judge_vlm, batch_size=args.batch_size, use_hsv=args.hsv_colors,
+                num_workers=args.num_workers, rule_fastpath=args.rule_fastpath
+            )
             results['Classic Agent'] = acc
         except Exception as e:
             logger.error(f"Error during Classic Agent evaluation: {e}", exc_info=True)
 
     if args.mode in ['dl', 'all']:
         try:
-            acc, _ = run_dl_agent_pipeline(vlm, dataset, judge_vlm)
+            acc, _ = run_dl_agent_pipeline(
+                vlm, dataset, judge_vlm, batch_size=args.batch_size, strict_cot=args.strict_cot
+            )
             results['DL Agent'] = acc
         except Exception as e:
             logger.error(f"Error during DL Agent evaluation: {e}", exc_info=True)
@@ -110,4 +169,6 @@ def main():
     logger.info("--- End of Report ---")
 
 if __name__ == "__main__":
+    # Setup logging (only in the main process; workers must not reopen the log file)
+    setup_logging()
     main()
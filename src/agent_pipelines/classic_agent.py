@@ -1,8 +1,14 @@
 import cv2
 import numpy as np
+from numba import njit, prange
 import logging
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from tqdm import tqdm
-from src.llm_judge import judge_answer
+from src.llm_judge import judge_answers_batch
+from src.utils import init_worker_logging, iter_dataset_batches, run_inference, start_worker_log_listener
 
 logger = logging.getLogger(__name__)
 
@@ -16,53 +22,152 @@ COLOR_BOUNDS = {
     'gray': ([0, 0, 40], [180, 50, 220]) # Includes black
 }
 
-def detect_objects(image_path):
+# HSV bounds packed into 9-bit lanes of a uint32 (H | S << 9 | V << 18), built
+# once at import. Bit 8 of each lane is a guard bit: it survives a lane-wise
+# subtraction only if that lane did not underflow, so one pixel is tested
+# against all three bounds of a range at once (SWAR). The wrapped upper red
+# range is tested first and shares the 'red' label; label k + 1 is _COLORS[k].
+_COLORS = ['red', 'green', 'blue', 'yellow', 'gray']
+_LANE_GUARDS = (1 << 8) | (1 << 17) | (1 << 26)
+
+def _pack_hsv(hsv):
+    return int(hsv[0]) | (int(hsv[1]) << 9) | (int(hsv[2]) << 18)
+
+_HSV_RANGES = [('red2', 'red')] + [(color, color) for color in _COLORS]
+_PACKED_LOWER = np.array([_pack_hsv(COLOR_BOUNDS[name][0]) for name, _ in _HSV_RANGES], dtype=np.uint32)
+_GUARDED_UPPER = np.array(
+    [_pack_hsv(COLOR_BOUNDS[name][1]) | _LANE_GUARDS for name, _ in _HSV_RANGES], dtype=np.uint32
+)
+_RANGE_LABELS = np.array([_COLORS.index(color) + 1 for _, color in _HSV_RANGES], dtype=np.uint8)
+
+def _is_gray(b, g, r):
+    brightest = np.maximum(np.maximum(b, g), r)
+    darkest = np.minimum(np.minimum(b, g), r)
+    return (brightest - darkest < 20) & (brightest >= 40) & (brightest <= 220)
+
+# Membership tests on raw BGR planes, calibrated on the synthetic dataset's
+# palette of pure hues. Images outside this palette should use the HSV path.
+BGR_RULES = {
+    'red': lambda b, g, r: (r > 150) & (g < 100) & (b < 120),
+    'green': lambda b, g, r: (g > 150) & (r < 120) & (b < 120),
+    'blue': lambda b, g, r: (b > 150) & (g < 100) & (r < 100),
+    'yellow': lambda b, g, r: (r > 150) & (g > 150) & (b < 100),
+    'gray': _is_gray
+}
+
+# Images are decoded at half resolution inside the codec, then downscaled
+# further so their longest side is at most MAX_DETECTION_DIM pixels
+IMREAD_FLAGS = cv2.IMREAD_REDUCED_COLOR_2
+IMREAD_SCALE = 0.5
+MAX_DETECTION_DIM = 256
+MIN_OBJECT_AREA = 100 # In original-image pixels
+
+# Resize large frames through OpenCV's T-API (cv2.UMat) when an OpenCL
+# device is available; otherwise everything stays on the NumPy path
+USE_OPENCL = cv2.ocl.haveOpenCL()
+
+@njit(parallel=True, cache=True)
+def classify_hsv(hsv, packed_lower, guarded_upper, range_labels):
+    """
+    Labels every pixel of an HSV image in a single compiled pass.
+    
+    Args:
+        hsv: (H, W, 3) uint8 HSV image.
+        packed_lower: (K,) uint32 packed inclusive lower bounds.
+        guarded_upper: (K,) uint32 packed inclusive upper bounds with lane guard bits set.
+        range_labels: (K,) uint8 label of each range.
+        
+    Returns:
+        np.ndarray: (H, W) uint8 label image; 0 is background, otherwise
+                    the label of the first matching range.
+    """
+    height, width, _ = hsv.shape
+    labels = np.zeros((height, width), np.uint8)
+    for y in prange(height):
+        for x in range(width):
+            packed = np.uint32(hsv[y, x, 0]) | (np.uint32(hsv[y, x, 1]) << 9) | (np.uint32(hsv[y, x, 2]) << 18)
+            guarded = packed | _LANE_GUARDS
+            for k in range(packed_lower.shape[0]):
+                # Guards survive both subtractions only if lower <= value <= upper in every lane
+                if ((guarded - packed_lower[k]) & (guarded_upper[k] - packed) & _LANE_GUARDS) == _LANE_GUARDS:
+                    labels[y, x] = range_labels[k]
+                    break
+    return labels
+
+# Compile once at import so the first image does not pay the JIT latency
+classify_hsv(np.zeros((1, 1, 3), np.uint8), _PACKED_LOWER, _GUARDED_UPPER, _RANGE_LABELS)
+
+def classify_bgr(image):
+    """
+    Labels every pixel of a BGR image using BGR_RULES, skipping the HSV conversion.
+    
+    Returns:
+        np.ndarray: (H, W) uint8 label image; 0 is background, otherwise
+                    k + 1 for the first matching color _COLORS[k].
+    """
+    b, g, r = image[..., 0], image[..., 1], image[..., 2]
+    conditions = [BGR_RULES[color](b, g, r) for color in _COLORS]
+    return np.select(conditions, np.arange(1, len(_COLORS) + 1, dtype=np.uint8), default=0).astype(np.uint8)
+
+def detect_objects(image_path, use_hsv=False):
     """
     Detects colored shapes (circles, squares) in an image using OpenCV.
     
+    Args:
+        image_path: Path to the image file.
+        use_hsv: Classify colors with the HSV bounds in COLOR_BOUNDS instead
+                 of the BGR rules, for images outside the synthetic palette.
+    
     Returns:
         list: A list of dictionaries, e.g.,
-              [{'color': 'red', 'shape': 'square', 'coords': (x, y)}]
+              [{'color': 'red', 'shape': 'square', 'coords': (x, y)}],
+              or None if the image could not be read or detection failed.
     """
     try:
-        image = cv2.imread(image_path)
+        image = cv2.imread(image_path, IMREAD_FLAGS)
         if image is None:
             logger.warning(f"Could not read image: {image_path}")
-            return []
+            return None
             
-        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+        # Downscale large images; coordinates are mapped back below
+        resize_scale = min(1.0, MAX_DETECTION_DIM / max(image.shape[:2]))
+        if resize_scale < 1.0:
+            source = cv2.UMat(image) if USE_OPENCL else image
+            image = cv2.resize(source, None, fx=resize_scale, fy=resize_scale, interpolation=cv2.INTER_AREA)
+            if USE_OPENCL:
+                # Pull the small frame back once; classification runs on the host
+                image = image.get()
+        scale = IMREAD_SCALE * resize_scale
+        min_area = MIN_OBJECT_AREA * scale ** 2
+
+        if use_hsv:
+            hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+            labels = classify_hsv(hsv, _PACKED_LOWER, _GUARDED_UPPER, _RANGE_LABELS)
+        else:
+            labels = classify_bgr(image)
+
         detected_objects = []
 
-        for color, (lower, upper) in COLOR_BOUNDS.items():
-            lower_bound = np.array(lower)
-            upper_bound = np.array(upper)
-            mask = cv2.inRange(hsv, lower_bound, upper_bound)
-            
-            # Handle red wrapping
-            if color == 'red2':
-                red_mask_1 = cv2.inRange(hsv, np.array(COLOR_BOUNDS['red'][0]), np.array(COLOR_BOUNDS['red'][1]))
-                mask = cv2.bitwise_or(mask, red_mask_1)
-                color = 'red' # Consolidate as 'red'
-            elif color == 'red':
-                continue # Handled by 'red2'
-            
-            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        for label, color in enumerate(_COLORS, start=1):
+            mask = (labels == label).astype(np.uint8)
+            # 16-bit labels suffice: a MAX_DETECTION_DIM**2 image has well under 65535 components
+            n, components, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8, ltype=cv2.CV_16U)
             
-            for cnt in contours:
-                if cv2.contourArea(cnt) < 100: # Ignore small noise
+            for i in range(1, n):
+                if stats[i, cv2.CC_STAT_AREA] < min_area: # Ignore small noise
                     continue
                 
-                # Get shape
+                # Get shape from the component's outline within its bounding box
+                x, y, w, h = stats[i, :4]
+                roi = (components[y:y + h, x:x + w] == i).astype(np.uint8)
+                contours, _ = cv2.findContours(roi, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+                cnt = max(contours, key=cv2.contourArea)
                 peri = cv2.arcLength(cnt, True)
                 approx = cv2.approxPolyDP(cnt, 0.04 * peri, True)
                 shape = "square" if len(approx) == 4 else "circle"
                 
-                # Get centroid
-                M = cv2.moments(cnt)
-                if M["m00"] == 0:
-                    continue
-                cX = int(M["m10"] / M["m00"])
-                cY = int(M["m01"] / M["m00"])
+                # Get centroid, mapping pixel centers back to the original image
+                cX, cY = (int((c + 0.5) / scale - 0.5) for c in centroids[i])
                 
                 detected_objects.append({'color': color, 'shape': shape, 'coords': (cX, cY)})
                 
@@ -70,49 +175,179 @@ def detect_objects(image_path):
         
     except Exception as e:
         logger.error(f"Error in OpenCV object detection for {image_path}: {e}")
-        return []
+        return None
+
+def build_scene_context(objects):
+    """
+    Formats detected objects into the "Scene Context" text given to the VLM.
+    """
+    if not objects:
+        return "Scene Context: No objects were detected by the CV system."
+
+    lines = [f"- A {obj['color']} {obj['shape']} at coordinates {obj['coords']}\n" for obj in objects]
+    return "Scene Context: The following objects were detected:\n" + "".join(lines)
+
+@lru_cache(maxsize=2048)
+def analyze_image(image_path, use_hsv=False):
+    """
+    Runs object detection once per image and caches the result, since
+    datasets usually ask several questions about the same image.
+    
+    Returns:
+        tuple: (objects, scene_context) where objects is a tuple of the
+               detection dicts, or None if detection failed. Treat the
+               cached objects as read-only.
+    """
+    objects = detect_objects(image_path, use_hsv=use_hsv)
+    if objects is not None:
+        objects = tuple(objects)
+    return objects, build_scene_context(objects)
+
+# Question patterns the rule fast path can answer from the detections alone.
+# Matched against the whole question, so any extra qualifier falls through to the VLM.
+_COLOR_NAMES = '|'.join(_COLORS)
+_HOW_MANY = re.compile(rf"how many (?:({_COLOR_NAMES}) )?(?:objects|shapes)(?: are there)?\??")
+_RELATIVE_ATTRIBUTE = re.compile(
+    rf"what is the (color|shape) of the object that is (closest to|furthest from) the ({_COLOR_NAMES}) object\??"
+)
+_ATTRIBUTE_OF_COLOR = re.compile(rf"what is the (color|shape) of the ({_COLOR_NAMES}) object\??")
+_ATTRIBUTE = re.compile(r"what (?:is the )?(color|shape)(?: is| of)? the object\??")
 
+def _unique_object(objects, color):
+    matches = [obj for obj in objects if obj['color'] == color]
+    return matches[0] if len(matches) == 1 else None
 
-def run_classic_agent_pipeline(vlm, dataset, judge_vlm):
+def try_rule_answer(question, objects):
+    """
+    Answers simple counting, color and shape questions directly from the
+    detected objects, without calling the VLM.
+    
+    Returns:
+        str or None: The answer, or None if no rule applies or the
+                     detections are ambiguous (including distance ties).
+    """
+    question = question.strip().lower()
+
+    match = _HOW_MANY.fullmatch(question)
+    if match:
+        color = match.group(1)
+        return str(sum(1 for obj in objects if color is None or obj['color'] == color))
+
+    match = _RELATIVE_ATTRIBUTE.fullmatch(question)
+    if match:
+        attribute, relation, color = match.groups()
+        anchor = _unique_object(objects, color)
+        others = [obj for obj in objects if obj is not anchor]
+        if anchor is None or not others:
+            return None
+        ax, ay = anchor['coords']
+        distances = [(obj['coords'][0] - ax) ** 2 + (obj['coords'][1] - ay) ** 2 for obj in others]
+        best = min(distances) if relation == 'closest to' else max(distances)
+        if distances.count(best) > 1:
+            return None
+        return others[distances.index(best)][attribute]
+
+    match = _ATTRIBUTE_OF_COLOR.fullmatch(question)
+    if match:
+        attribute, color = match.groups()
+        obj = _unique_object(objects, color)
+        return obj[attribute] if obj else None
+
+    match = _ATTRIBUTE.fullmatch(question)
+    if match and len(objects) == 1:
+        return objects[0][match.group(1)]
+
+    return None
+
+def prefetch_analyses(pool, image_paths, use_hsv=False):
+    """
+    Submits `analyze_image` to a process pool once per distinct image path,
+    so CV work overlaps with VLM inference in the main process.
+    
+    Returns:
+        dict: Mapping of image_path -> Future of (objects, scene_context).
+    """
+    return {
+        image_path: pool.submit(analyze_image, image_path, use_hsv)
+        for image_path in dict.fromkeys(image_paths)
+    }
+
+
+def run_classic_agent_pipeline(vlm, dataset, judge_vlm, batch_size=8, use_hsv=False,
+                               num_workers=0, rule_fastpath=False):
     """
     Runs the Classic (CV-Enhanced) Agent pipeline on the dataset.
+    `use_hsv` selects the HSV color classifier in `detect_objects`.
+    Object detection runs inline by default; `num_workers` > 0 prefetches it
+    in that many processes, which only pays off when detection is slow
+    relative to the pool's startup (large images or datasets).
+    With `rule_fastpath`, questions `try_rule_answer` can handle skip the
+    VLM; their answers are still scored by the judge.
     """
     logger.info("Starting Classic Agent (CV-Enhanced) evaluation...")
     predictions = []
-    scores = []
-    
+    judge_inputs = []
+
+    pool, log_listener = None, None
     try:
-        for index, row in tqdm(dataset.iterrows(), total=len(dataset), desc="Classic Agent Eval"):
-            question = row['question']
-            ground_truth = row['answer']
-            image_path = row['image_path']
-            
-            # 1. Detect objects with OpenCV
-            objects = detect_objects(image_path)
-            if not objects:
-                scene_context = "Scene Context: No objects were detected by the CV system."
-            else:
-                scene_context = "Scene Context: The following objects were detected:\n"
-                for obj in objects:
-                    scene_context += f"- A {obj['color']} {obj['shape']} at coordinates {obj['coords']}\n"
-            
-            # 2. Enhance the prompt
-            enhanced_prompt = (
-                f"{scene_context}\n"
-                "Based *only* on the scene context provided above, answer the following question.\n"
-                f"Question: {question}"
-            )
-            
-            # 3. Get model's prediction
-            model_answer_list = vlm.inference(prompt=enhanced_prompt, image_path=image_path)
-            model_answer = model_answer_list[0] if model_answer_list else ""
-            predictions.append(model_answer)
-            
-            # 4. Judge the prediction
-            score = judge_answer(judge_vlm, question, model_answer, ground_truth)
-            scores.append(score)
+        analyses = {}
+        if num_workers > 0:
+            # Forked workers would inherit Numba's thread pool (and any CUDA state), so start clean ones
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            ctx = multiprocessing.get_context(start_method)
+            if start_method == "forkserver":
+                # Keep the server bare: preloading the caller's __main__ drags in its imports, and
+                # preloading this module starts Numba's thread pool there, which hangs the server at exit
+                ctx.set_forkserver_preload([])
+            # Worker log records are written by this process's handlers
+            log_queue = ctx.Queue()
+            log_listener = start_worker_log_listener(log_queue)
+            pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=ctx, initializer=init_worker_logging,
+                                       initargs=(log_queue, logging.getLogger().getEffectiveLevel()))
+            analyses = prefetch_analyses(pool, dataset['image_path'], use_hsv)
 
-        # 5. Calculate final accuracy
+        with tqdm(total=len(dataset), desc="Classic Agent Eval") as pbar:
+            for batch_questions, batch_image_paths, batch_ground_truths in iter_dataset_batches(dataset, batch_size):
+                model_answers = [None] * len(batch_questions)
+                enhanced_prompts, vlm_indices = [], []
+                for i, (question, image_path) in enumerate(zip(batch_questions, batch_image_paths)):
+                    # 1. Detect objects with OpenCV (prefetched and cached per image)
+                    if image_path in analyses:
+                        objects, scene_context = analyses[image_path].result()
+                    else:
+                        objects, scene_context = analyze_image(image_path, use_hsv=use_hsv)
+
+                    # Answer directly from the detections when a rule applies
+                    # (never for failed detections, which would look like an empty scene)
+                    if rule_fastpath and objects is not None:
+                        model_answers[i] = try_rule_answer(question, objects)
+                        if model_answers[i] is not None:
+                            continue
+
+                    # 2. Enhance the prompt
+                    enhanced_prompts.append(
+                        f"{scene_context}\n"
+                        "Based *only* on the scene context provided above, answer the following question.\n"
+                        f"Question: {question}"
+                    )
+                    vlm_indices.append(i)
+
+                # 3. Get model's predictions for the remaining rows
+                vlm_image_paths = [batch_image_paths[i] for i in vlm_indices]
+                vlm_answers = run_inference(vlm, enhanced_prompts, vlm_image_paths, batch_size) if enhanced_prompts else []
+                for i, model_answer in zip(vlm_indices, vlm_answers):
+                    model_answers[i] = model_answer
+                predictions.extend(model_answers)
+
+                # 4. Collect the predictions for judging
+                judge_inputs.extend(zip(batch_questions, model_answers, batch_ground_truths))
+
+                pbar.update(len(batch_questions))
+
+        # 5. Judge all predictions in batches
+        scores = judge_answers_batch(judge_vlm, judge_inputs, batch_size=batch_size)
+
+        # 6. Calculate final accuracy
         accuracy = sum(scores) / len(scores) if scores else 0
         logger.info(f"Classic Agent Evaluation Complete. Accuracy: {accuracy:.4f}")
         
@@ -121,3 +356,9 @@ def run_classic_agent_pipeline(vlm, dataset, judge_vlm):
     except Exception as e:
         logger.error(f"Error during Classic Agent loop: {e}", exc_info=True)
         return 0.0, predictions
+
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if log_listener:
+            log_listener.stop()
@@ -1,58 +1,107 @@
 import logging
+import re
 from tqdm import tqdm
-from src.llm_judge import judge_answer
+from src.llm_judge import judge_answers_batch
+from src.utils import iter_dataset_batches, run_inference
 
 logger = logging.getLogger(__name__)
 
-def run_dl_agent_pipeline(vlm, dataset, judge_vlm):
+# Single-call CoT prompt: plan, context and answer in one generation
+FUSED_PROMPT_TEMPLATE = """To answer the question '{question}', reason step by step.
+First list the step-by-step reasoning plan you will follow.
+Then describe all objects in the image in detail. For each object, list its color, its shape, and its relative position (e.g., top-left, bottom-right).
+Finally, give the final, concise answer to the question.
+
+Use exactly this format:
+PLAN:
+...
+CONTEXT:
+...
+ANSWER:
+<one line>"""
+
+_ANSWER_PATTERN = re.compile(r'ANSWER:\s*(.+)')
+
+def _extract_answer(text):
+    """
+    Returns the line after the last "ANSWER:" marker, or the whole response
+    if the model did not follow the format.
+    """
+    answers = _ANSWER_PATTERN.findall(text)
+    return answers[-1].strip() if answers else text.strip()
+
+def _fused_cot_answers(vlm, questions, image_paths, batch_size):
+    """
+    Plans, extracts context and answers with a single VLM call per row,
+    so each image is encoded once.
+    """
+    prompts = [FUSED_PROMPT_TEMPLATE.format(question=question) for question in questions]
+    outputs = run_inference(vlm, prompts, image_paths, batch_size, max_new_tokens=300)
+    return [_extract_answer(output) for output in outputs]
+
+def _strict_cot_answers(vlm, questions, image_paths, batch_size):
+    """
+    Runs the plan, context and answer steps as three separate VLM calls per row.
+    """
+    # 1. Agent Step 1: Decompose the question
+    plan_prompts = [
+        (
+            f"To answer the question '{question}', "
+            "what is the step-by-step reasoning plan I should follow? "
+            "List the steps."
+        )
+        for question in questions
+    ]
+    plans = run_inference(vlm, plan_prompts, image_paths, batch_size, max_new_tokens=100)
+
+    # 2. Agent Step 2: Extract visual context
+    extract_prompt = (
+        "Describe all objects in the image in detail. For each object, "
+        "list its color, its shape, and its relative position (e.g., top-left, bottom-right)."
+    )
+    contexts = run_inference(vlm, [extract_prompt] * len(questions), image_paths, batch_size, max_new_tokens=150)
+
+    # 3. Agent Step 3: Synthesize the final answer
+    final_prompts = [
+        (
+            f"You are a reasoning agent. Use the following information to answer the question.\n\n"
+            f"Original Question: {question}\n\n"
+            f"Reasoning Plan:\n{plan}\n\n"
+            f"Image Context:\n{context}\n\n"
+            "Based on the plan and context, what is the final, concise answer to the original question?"
+        )
+        for question, plan, context in zip(questions, plans, contexts)
+    ]
+    return run_inference(vlm, final_prompts, image_paths, batch_size)
+
+def run_dl_agent_pipeline(vlm, dataset, judge_vlm, batch_size=8, strict_cot=False):
     """
     Runs the DL (Chain-of-Thought) Agent pipeline on the dataset.
     This simulates a ReAct/CoT agent by breaking the problem down.
+    By default the plan, context and answer come from one structured VLM
+    call per row; `strict_cot` runs them as three separate calls instead.
     """
     logger.info("Starting DL Agent (Chain-of-Thought) evaluation...")
     predictions = []
-    scores = []
+    judge_inputs = []
+    answer_fn = _strict_cot_answers if strict_cot else _fused_cot_answers
     
     try:
-        for index, row in tqdm(dataset.iterrows(), total=len(dataset), desc="DL Agent Eval"):
-            question = row['question']
-            ground_truth = row['answer']
-            image_path = row['image_path']
-            
-            # 1. Agent Step 1: Decompose the question
-            plan_prompt = (
-                f"To answer the question '{question}', "
-                "what is the step-by-step reasoning plan I should follow? "
-                "List the steps."
-            )
-            plan_list = vlm.inference(prompt=plan_prompt, image_path=image_path, max_new_tokens=100)
-            plan = plan_list[0] if plan_list else "No plan generated."
-
-            # 2. Agent Step 2: Extract visual context
-            extract_prompt = (
-                "Describe all objects in the image in detail. For each object, "
-                "list its color, its shape, and its relative position (e.g., top-left, bottom-right)."
-            )
-            context_list = vlm.inference(prompt=extract_prompt, image_path=image_path, max_new_tokens=150)
-            context = context_list[0] if context_list else "No context extracted."
-
-            # 3. Agent Step 3: Synthesize the final answer
-            final_prompt = (
-                f"You are a reasoning agent. Use the following information to answer the question.\n\n"
-                f"Original Question: {question}\n\n"
-                f"Reasoning Plan:\n{plan}\n\n"
-                f"Image Context:\n{context}\n\n"
-                "Based on the plan and context, what is the final, concise answer to the original question?"
-            )
-            model_answer_list = vlm.inference(prompt=final_prompt, image_path=image_path)
-            model_answer = model_answer_list[0] if model_answer_list else ""
-            predictions.append(model_answer)
-            
-            # 4. Judge the prediction
-            score = judge_answer(judge_vlm, question, model_answer, ground_truth)
-            scores.append(score)
-
-        # 5. Calculate final accuracy
+        with tqdm(total=len(dataset), desc="DL Agent Eval") as pbar:
+            for batch_questions, batch_image_paths, batch_ground_truths in iter_dataset_batches(dataset, batch_size):
+                # 1. Run the agent steps
+                model_answers = answer_fn(vlm, batch_questions, batch_image_paths, batch_size)
+                predictions.extend(model_answers)
+
+                # 2. Collect the predictions for judging
+                judge_inputs.extend(zip(batch_questions, model_answers, batch_ground_truths))
+
+                pbar.update(len(batch_questions))
+
+        # 3. Judge all predictions in batches
+        scores = judge_answers_batch(judge_vlm, judge_inputs, batch_size=batch_size)
+
+        # 4. Calculate final accuracy
         accuracy = sum(scores) / len(scores) if scores else 0
         logger.info(f"DL Agent Evaluation Complete. Accuracy: {accuracy:.4f}")
         
@@ -6,10 +6,16 @@ import logging
 
 logger = logging.getLogger(__name__)
 
-def load_dataset(csv_path, images_dir):
+def load_dataset(csv_path, images_dir, check_paths=False):
     """
     Loads the VQA dataset from a CSV file and validates image paths.
     
+    Args:
+        csv_path: Path to the dataset CSV file.
+        images_dir: Directory containing the '<Image>.png' files.
+        check_paths: Check that every image exists, not just the first one.
+                     Off by default since it is slow on networked filesystems.
+    
     Returns:
         pd.DataFrame or None: DataFrame with 'Image', 'question', 'answer', 'image_path'
                                or None if loading fails.
@@ -18,11 +24,16 @@ def load_dataset(csv_path, images_dir):
         df = pd.read_csv(csv_path)
         logger.info(f"Loaded dataset from {csv_path} with {len(df)} rows.")
         
-        # Create full image paths and check existence
-        df['image_path'] = df['Image'].apply(lambda x: os.path.join(images_dir, f"{x}.png"))
+        # Create full image paths with a vectorized string concat
+        df['image_path'] = os.path.join(images_dir, "") + df['Image'].astype(str) + ".png"
         
-        # Optional: Check for first few images to ensure path is correct
-        if not os.path.exists(df['image_path'].iloc[0]):
+        if check_paths:
+            missing = df['image_path'][~df['image_path'].map(os.path.exists)]
+            if not missing.empty:
+                logger.warning(f"{len(missing)} image(s) not found, first at: {missing.iloc[0]}. "
+                               "Please check --images_dir.")
+        # Otherwise only check the first image to ensure the path is correct
+        elif not os.path.exists(df['image_path'].iloc[0]):
              logger.warning(f"Image not found at: {df['image_path'].iloc[0]}. Please check --images_dir.")
         
         return df
@@ -1,9 +1,11 @@
 import logging
-import re
+from src.utils import batched
 
 logger = logging.getLogger(__name__)
 
-JUDGE_PROMPT_TEMPLATE = """
+# The fixed instructions come first so they can be tokenized once and shared
+# as an identical prefix by every judge prompt
+JUDGE_PROMPT_PREFIX = """
 You are an expert evaluator for a Visual Question Answering task.
 Your goal is to determine if the "Model's Answer" correctly and concisely answers the "Question" based on the "Ground Truth Answer".
 
@@ -15,7 +17,9 @@ For "What is the color..." questions, the answer must be the color (e.g., "red"
 Respond with only "Yes" or "No". Do not provide any explanation.
 
 ---
-Question: "{question}"
+"""
+
+JUDGE_PROMPT_SUFFIX_TEMPLATE = """Question: "{question}"
 Ground Truth Answer: "{ground_truth}"
 Model's Answer: "{model_answer}"
 ---
@@ -23,6 +27,33 @@ Model's Answer: "{model_answer}"
 Is the Model's Answer correct?
 """
 
+JUDGE_PROMPT_TEMPLATE = JUDGE_PROMPT_PREFIX + JUDGE_PROMPT_SUFFIX_TEMPLATE
+
+# Only "Yes" / "No" is needed from the judge
+JUDGE_MAX_NEW_TOKENS = 2
+
+def _normalize(question, model_answer, ground_truth):
+    """
+    Builds the dedup key for a judge call; answers are compared case- and whitespace-insensitively.
+    """
+    return question, str(model_answer).strip().lower(), str(ground_truth).strip().lower()
+
+def _parse_decision(response):
+    """
+    Maps a raw judge response to a score.
+    
+    Returns:
+        int: 1 if the judge said yes, 0 otherwise.
+    """
+    decision = response.strip().lower()
+    if decision.startswith('yes'):
+        return 1
+    if decision.startswith('no'):
+        return 0
+    logger.warning(f"Judge VLM returned ambiguous response: '{response}'")
+    # Default to incorrect if response is not clear
+    return 0
+
 def judge_answer(vlm, question, model_answer, ground_truth):
     """
     Uses the VLM to judge if a model's answer is correct given the ground truth.
@@ -37,25 +68,75 @@ def judge_answer(vlm, question, model_answer, ground_truth):
     )
     
     try:
-        response = vlm.inference(prompt=prompt, image_path=None, max_new_tokens=5)
+        response = vlm.inference_one(prompt=prompt, image_path=None, max_new_tokens=JUDGE_MAX_NEW_TOKENS)
         
         if not response:
             logger.warning("Judge VLM returned no response.")
             return 0
             
-        # Clean the response
-        decision = response[0].strip().lower()
-        
-        # Use regex to find 'yes' or 'no'
-        if re.search(r'\byes\b', decision):
-            return 1
-        elif re.search(r'\bno\b', decision):
-            return 0
-        else:
-            logger.warning(f"Judge VLM returned ambiguous response: '{response[0]}'")
-            # Default to incorrect if response is not clear
-            return 0
+        return _parse_decision(response)
             
     except Exception as e:
         logger.error(f"Error during LLM judge inference: {e}")
         return 0
+
+def _judge_prompt_affix_ids(vlm):
+    """
+    Tokenizes the chat head plus the fixed judge instructions.
+    
+    Returns:
+        tuple: (prefix_ids, chat_tail) for building pre-tokenized judge prompts.
+    """
+    head, tail = vlm.chat_prompt_affixes()
+    return vlm.encode_text(head + JUDGE_PROMPT_PREFIX), tail
+
+def judge_answers_batch(vlm, judge_inputs, batch_size=8):
+    """
+    Judges a list of (question, model_answer, ground_truth) triples.
+    Triples that match after case- and whitespace-normalizing the answers
+    are judged once (the judge sees the first original triple), and unique
+    prompts are sent to the VLM in batches of `batch_size`; values <= 1
+    use `judge_answer` per unique triple. Only the per-sample part of each
+    prompt is tokenized; the shared instruction prefix is tokenized once per call.
+    
+    Returns:
+        list: One score (1 or 0) per input triple, in input order.
+    """
+    keys = [_normalize(*triple) for triple in judge_inputs]
+    unique_inputs = {}
+    for key, triple in zip(keys, judge_inputs):
+        unique_inputs.setdefault(key, triple)
+    results = {}
+
+    if batch_size <= 1:
+        for key, triple in unique_inputs.items():
+            results[key] = judge_answer(vlm, *triple)
+    else:
+        try:
+            prefix_ids, chat_tail = _judge_prompt_affix_ids(vlm)
+        except Exception as e:
+            logger.error(f"Error tokenizing the judge prompt prefix: {e}")
+            return [0] * len(keys)
+
+        for chunk in batched(list(unique_inputs.items()), batch_size):
+            try:
+                input_ids_list = [
+                    prefix_ids + vlm.encode_text(
+                        JUDGE_PROMPT_SUFFIX_TEMPLATE.format(
+                            question=question,
+                            ground_truth=ground_truth,
+                            model_answer=model_answer
+                        ) + chat_tail
+                    )
+                    for _, (question, model_answer, ground_truth) in chunk
+                ]
+                responses = vlm.inference_from_ids(input_ids_list, max_new_tokens=JUDGE_MAX_NEW_TOKENS)
+                for (key, _), response in zip(chunk, responses):
+                    results[key] = _parse_decision(response)
+            except Exception as e:
+                logger.error(f"Error during batched LLM judge inference: {e}")
+                for key, _ in chunk:
+                    results[key] = 0
+
+    logger.info(f"Judged {len(keys)} answers with {len(unique_inputs)} unique judge calls.")
+    return [results[key] for key in keys]
@@ -1,12 +1,95 @@
 import torch
 import logging
 from PIL import Image
-from transformers import AutoProcessor, Qwen2_5_VLForConditionalGeneration
+from transformers import (
+    AutoConfig, AutoModelForCausalLM, AutoProcessor, AutoTokenizer, BitsAndBytesConfig,
+    Qwen2_5_VLForConditionalGeneration
+)
 from qwen_vl_utils import process_vision_info
 
 logger = logging.getLogger(__name__)
 
-class QwenVLM:
+def is_vision_language_model(model_name):
+    """
+    Checks the model's config (Hub id or local path) for a vision tower, so the
+    right wrapper can be chosen regardless of how the checkpoint is named.
+    
+    Returns:
+        bool: True for vision-language models (load with QwenVLM), False for text-only ones.
+    """
+    config = AutoConfig.from_pretrained(model_name)
+    return getattr(config, "vision_config", None) is not None
+
+class _QwenChatModel:
+    """
+    Shared text-generation helpers for the Qwen wrappers. Subclasses set
+    `model`, `tokenizer` and `device`, and implement `inference` and `_chat_text`.
+    """
+    def inference_one(self, prompt="Describe this image.", image_path=None, max_new_tokens=128):
+        """
+        Performs single-prompt inference and returns the output string directly.
+        
+        Returns:
+            str: The generated text, or "" if there was no output.
+        """
+        output_text = self.inference(prompt=prompt, image_path=image_path, max_new_tokens=max_new_tokens)
+        return output_text[0] if output_text else ""
+
+    def chat_prompt_affixes(self):
+        """
+        Returns the (head, tail) text the chat template wraps around a
+        text-only user prompt, so fixed prompt parts can be pre-tokenized.
+        """
+        marker = "<<PROMPT>>"
+        head, tail = self._chat_text(marker).split(marker)
+        return head, tail
+
+    def encode_text(self, text):
+        """
+        Tokenizes text without adding special tokens.
+        
+        Returns:
+            list: Token ids.
+        """
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+    def inference_from_ids(self, input_ids_list, max_new_tokens=128):
+        """
+        Performs text-only inference on pre-tokenized prompts, left-padded
+        into a single batch.
+        
+        Args:
+            input_ids_list: List of token id lists, each a full chat-formatted prompt.
+            max_new_tokens: Maximum number of tokens to generate per prompt.
+        
+        Returns:
+            list: One output string per prompt, in input order.
+        """
+        try:
+            max_len = max(len(ids) for ids in input_ids_list)
+            input_ids = torch.full((len(input_ids_list), max_len), self.tokenizer.pad_token_id, dtype=torch.long)
+            attention_mask = torch.zeros_like(input_ids)
+            for i, ids in enumerate(input_ids_list):
+                input_ids[i, max_len - len(ids):] = torch.tensor(ids, dtype=torch.long)
+                attention_mask[i, max_len - len(ids):] = 1
+
+            generated_ids = self.model.generate(
+                input_ids=input_ids.to(self.device),
+                attention_mask=attention_mask.to(self.device),
+                max_new_tokens=max_new_tokens
+            )
+
+            return self.tokenizer.batch_decode(
+                generated_ids[:, max_len:],
+                skip_special_tokens=True,
+                clean_up_tokenization_spaces=False,
+            )
+
+        except Exception as e:
+            logger.error(f"Error during inference from token ids: {e}", exc_info=True)
+            return [f"Error: Inference failed. {e}"] * len(input_ids_list)
+
+class QwenVLM(_QwenChatModel):
     """
     A wrapper class for the Qwen2.5-VL-3B-Instruct model.
     Handles model loading, processing, and inference.
@@ -27,6 +110,9 @@ class QwenVLM:
             )
             
             self.processor = AutoProcessor.from_pretrained(model_name)
+            # Decoder-only generation needs left padding for batched prompts
+            self.processor.tokenizer.padding_side = "left"
+            self.tokenizer = self.processor.tokenizer
             logger.info("Model and processor loaded successfully.")
 
         except ImportError:
@@ -36,6 +122,12 @@ class QwenVLM:
             logger.error(f"Error loading model: {e}")
             raise
 
+    def _chat_text(self, prompt):
+        messages = [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
+        return self.processor.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True
+        )
+
     def inference(self, prompt="Describe this image.", image_path=None, max_new_tokens=128):
         """
         Performs inference with or without an image.
@@ -86,3 +178,160 @@ class QwenVLM:
         except Exception as e:
             logger.error(f"Error during VLM inference: {e}", exc_info=True)
             return [f"Error: Inference failed. {e}"]
+
+    def inference_batch(self, prompts, image_paths=None, max_new_tokens=128):
+        """
+        Performs inference on a batch of prompts in a single padded forward pass.
+
+        Args:
+            prompts: List of text prompts.
+            image_paths: List of image paths (entries may be None), or None for text-only.
+            max_new_tokens: Maximum number of tokens to generate per prompt.
+
+        Returns:
+            list: One output string per prompt, in input order.
+        """
+        if image_paths is None:
+            image_paths = [None] * len(prompts)
+
+        outputs = [""] * len(prompts)
+        batch_indices, batch_messages = [], []
+
+        for i, (prompt, image_path) in enumerate(zip(prompts, image_paths)):
+            content = []
+            if image_path:
+                try:
+                    image = Image.open(image_path).convert("RGB")
+                    content.append({"type": "image", "image": image})
+                except FileNotFoundError:
+                    logger.error(f"Image file not found: {image_path}")
+                    outputs[i] = f"Error: Image file not found at {image_path}"
+                    continue
+                except Exception as e:
+                    logger.error(f"Error processing image {image_path}: {e}")
+                    outputs[i] = f"Error: Could not process image. {e}"
+                    continue
+            content.append({"type": "text", "text": prompt})
+            batch_indices.append(i)
+            batch_messages.append([{"role": "user", "content": content}])
+
+        if not batch_messages:
+            return outputs
+
+        try:
+            texts = [
+                self.processor.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+                for messages in batch_messages
+            ]
+            image_inputs, video_inputs = process_vision_info(batch_messages)
+
+            inputs = self.processor(
+                text=texts,
+                images=image_inputs,
+                videos=video_inputs,
+                padding=True,
+                return_tensors="pt",
+            ).to(self.device)
+
+            generated_ids = self.model.generate(**inputs, max_new_tokens=max_new_tokens)
+            generated_ids_trimmed = [
+                out_ids[len(in_ids):] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
+            ]
+
+            output_text = self.processor.batch_decode(
+                generated_ids_trimmed,
+                skip_special_tokens=True,
+                clean_up_tokenization_spaces=False,
+            )
+            for i, text in zip(batch_indices, output_text):
+                outputs[i] = text
+            return outputs
+
+        except Exception as e:
+            logger.error(f"Error during batched VLM inference: {e}", exc_info=True)
+            for i in batch_indices:
+                outputs[i] = f"Error: Inference failed. {e}"
+            return outputs
+
+
+class QwenLLM(_QwenChatModel):
+    """
+    A wrapper class for text-only Qwen instruct models (e.g. Qwen2.5-1.5B-Instruct),
+    optionally loaded with 8-bit or 4-bit bitsandbytes weights. Used as a cheap
+    judge: it exposes the same inference methods as QwenVLM but has no image tower.
+    """
+    def __init__(self, model_name="Qwen/Qwen2.5-1.5B-Instruct", device=None, quantization=None):
+        try:
+            if device is None:
+                self.device = "cuda" if torch.cuda.is_available() else "cpu"
+            else:
+                self.device = device
+
+            quantization_config = None
+            if quantization and self.device != "cuda":
+                logger.warning(f"{quantization} quantization needs CUDA; loading '{model_name}' unquantized.")
+            elif quantization == "8bit":
+                quantization_config = BitsAndBytesConfig(load_in_8bit=True)
+            elif quantization == "4bit":
+                quantization_config = BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_compute_dtype=torch.bfloat16
+                )
+
+            logger.info(f"Loading model '{model_name}' to device '{self.device}' "
+                        f"(quantization: {quantization or 'none'})...")
+
+            self.model = AutoModelForCausalLM.from_pretrained(
+                model_name,
+                torch_dtype="auto",
+                device_map="auto" if self.device == "cuda" else self.device,
+                quantization_config=quantization_config
+            )
+
+            self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+            # Decoder-only generation needs left padding for batched prompts
+            self.tokenizer.padding_side = "left"
+            logger.info("Model and tokenizer loaded successfully.")
+
+        except Exception as e:
+            logger.error(f"Error loading model: {e}")
+            raise
+
+    def _chat_text(self, prompt):
+        messages = [{"role": "user", "content": prompt}]
+        return self.tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=True
+        )
+
+    def inference(self, prompt="Describe this image.", image_path=None, max_new_tokens=128):
+        """
+        Performs text-only inference. `image_path` is accepted for interface
+        compatibility with QwenVLM and ignored.
+        """
+        return self.inference_batch([prompt], [image_path], max_new_tokens=max_new_tokens)
+
+    def inference_batch(self, prompts, image_paths=None, max_new_tokens=128):
+        """
+        Performs text-only inference on a batch of prompts in a single padded forward pass.
+        
+        Returns:
+            list: One output string per prompt, in input order.
+        """
+        if image_paths is not None and any(image_paths):
+            logger.warning("QwenLLM is text-only; ignoring image inputs.")
+
+        try:
+            texts = [self._chat_text(prompt) for prompt in prompts]
+            inputs = self.tokenizer(texts, padding=True, return_tensors="pt").to(self.device)
+
+            generated_ids = self.model.generate(**inputs, max_new_tokens=max_new_tokens)
+
+            return self.tokenizer.batch_decode(
+                generated_ids[:, inputs.input_ids.shape[1]:],
+                skip_special_tokens=True,
+                clean_up_tokenization_spaces=False,
+            )
+
+        except Exception as e:
+            logger.error(f"Error during LLM inference: {e}", exc_info=True)
+            return [f"Error: Inference failed. {e}"] * len(prompts)
@@ -1,7 +1,9 @@
 import logging
 import sys
 import os
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+logger = logging.getLogger(__name__)
 
 def setup_logging(log_dir="logs", log_file="evaluation.log"):
     """
@@ -17,8 +19,10 @@ def setup_logging(log_dir="logs", log_file="evaluation.log"):
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
     
-    # Clear existing handlers to avoid duplicates
+    # Clear existing handlers to avoid duplicates (closing releases the log file)
     if logger.hasHandlers():
+        for handler in logger.handlers:
+            handler.close()
         logger.handlers.clear()
 
     # Create console handler
@@ -28,8 +32,8 @@ def setup_logging(log_dir="logs", log_file="evaluation.log"):
                                           datefmt='%Y-%m-%d %H:%M:%S')
     console_handler.setFormatter(console_formatter)
 
-    # Create file handler
-    file_handler = RotatingFileHandler(log_path, maxBytes=5*1024*1024, backupCount=2)
+    # Create file handler (the file is opened lazily on the first record)
+    file_handler = RotatingFileHandler(log_path, maxBytes=5*1024*1024, backupCount=2, delay=True)
     file_handler.setLevel(logging.INFO)
     file_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s',
                                        datefmt='%Y-%m-%d %H:%M:%S')
@@ -40,3 +44,79 @@ def setup_logging(log_dir="logs", log_file="evaluation.log"):
     logger.addHandler(file_handler)
 
     logging.info("Logging configured successfully.")
+
+def start_worker_log_listener(log_queue):
+    """
+    Starts a listener that passes log records sent by worker processes to the
+    root logger's handlers in this process, so only this process writes the log file.
+    
+    Returns:
+        QueueListener: The running listener; call `stop()` once the workers exit.
+    """
+    handlers = logging.getLogger().handlers or [logging.lastResort]
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+def init_worker_logging(log_queue, level=logging.INFO):
+    """
+    Process pool initializer: sends the worker's log records to `log_queue`
+    instead of its own handlers, so the main process stays the only writer
+    of the rotating log file.
+    """
+    logger = logging.getLogger()
+    logger.setLevel(level)
+    for handler in logger.handlers:
+        handler.close()
+    logger.handlers.clear()
+    logger.addHandler(QueueHandler(log_queue))
+
+def batched(items, batch_size):
+    """
+    Yields successive lists of at most `batch_size` items from an iterable.
+    """
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_dataset_batches(dataset, batch_size):
+    """
+    Yields (questions, image_paths, ground_truths) lists for successive runs of
+    `batch_size` dataset rows (one row at a time when `batch_size` <= 1).
+    """
+    # Column arrays avoid building a pandas object per row
+    questions = dataset['question'].to_numpy()
+    ground_truths = dataset['answer'].to_numpy()
+    image_paths = dataset['image_path'].to_numpy()
+    step = max(batch_size, 1)
+
+    for start in range(0, len(dataset), step):
+        batch = slice(start, start + step)
+        yield questions[batch].tolist(), image_paths[batch].tolist(), ground_truths[batch].tolist()
+
+def run_inference(vlm, prompts, image_paths, batch_size, max_new_tokens=128):
+    """
+    Sends one batch of prompts to the VLM. With `batch_size` > 1 they go in a
+    single padded `inference_batch` call; values <= 1 use the per-row (scalar)
+    `inference_one` path. Empty outputs are logged.
+    
+    Returns:
+        list: One output string per prompt, in input order.
+    """
+    if batch_size > 1:
+        outputs = vlm.inference_batch(prompts=prompts, image_paths=image_paths, max_new_tokens=max_new_tokens)
+    else:
+        outputs = [
+            vlm.inference_one(prompt=prompt, image_path=image_path, max_new_tokens=max_new_tokens)
+            for prompt, image_path in zip(prompts, image_paths)
+        ]
+
+    for image_path, output in zip(image_paths, outputs):
+        if not output:
+            logger.warning(f"VLM returned no answer for image {image_path}")
+    return outputs
@@ -1,10 +1,11 @@
 import logging
 from tqdm import tqdm
-from src.llm_judge import judge_answer
+from src.llm_judge import judge_answers_batch
+from src.utils import iter_dataset_batches, run_inference
 
 logger = logging.getLogger(__name__)
 
-def run_zero_shot(vlm, dataset, judge_vlm):
+def run_zero_shot(vlm, dataset, judge_vlm, batch_size=8):
     """
     Runs zero-shot evaluation on the entire dataset.
     
@@ -12,36 +13,32 @@ def run_zero_shot(vlm, dataset, judge_vlm):
         vlm: The VLM model to test.
         dataset: The pandas DataFrame with questions and image paths.
         judge_vlm: The VLM model to use as a judge.
+        batch_size: Number of rows per VLM call (see `run_inference`).
         
     Returns:
         tuple: (accuracy, predictions_list)
     """
     logger.info("Starting Zero-Shot evaluation...")
     predictions = []
-    scores = []
+    judge_inputs = []
 
     try:
-        for index, row in tqdm(dataset.iterrows(), total=len(dataset), desc="Zero-Shot Eval"):
-            question = row['question']
-            ground_truth = row['answer']
-            image_path = row['image_path']
-            
-            # 1. Get model's prediction
-            model_answer_list = vlm.inference(prompt=question, image_path=image_path)
-            
-            if not model_answer_list:
-                logger.warning(f"VLM returned no answer for index {index}")
-                model_answer = ""
-            else:
-                model_answer = model_answer_list[0]
-            
-            predictions.append(model_answer)
-            
-            # 2. Judge the prediction
-            score = judge_answer(judge_vlm, question, model_answer, ground_truth)
-            scores.append(score)
-
-        # 3. Calculate final accuracy
+        with tqdm(total=len(dataset), desc="Zero-Shot Eval") as pbar:
+            for batch_questions, batch_image_paths, batch_ground_truths in iter_dataset_batches(dataset, batch_size):
+                # 1. Get model's predictions
+                model_answers = run_inference(vlm, batch_questions, batch_image_paths, batch_size)
+
+                predictions.extend(model_answers)
+
+                # 2. Collect the predictions for judging
+                judge_inputs.extend(zip(batch_questions, model_answers, batch_ground_truths))
+
+                pbar.update(len(batch_questions))
+
+        # 3. Judge all predictions in batches
+        scores = judge_answers_batch(judge_vlm, judge_inputs, batch_size=batch_size)
+
+        # 4. Calculate final accuracy
         accuracy = sum(scores) / len(scores) if scores else 0
         logger.info(f"Zero-Shot Evaluation Complete. Accuracy: {accuracy:.4f}")
         